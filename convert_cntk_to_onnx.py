@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""Export pre-trained CNTK enhancement models to ONNX.
+
+Denoising with ONNX Runtime (``main_denoising.py --backend onnx``) requires
+ONNX exports of the pre-trained models, which this script creates. Exports are
+written to ``model/`` and only need to be created once. To export all models:
+
+    python convert_cntk_to_onnx.py
+
+To export only the third stage of the "1000h" model:
+
+    python convert_cntk_to_onnx.py --model_select 1000h --stage_select 3
+
+To additionally create FP16 versions of the exports, which are used by
+``main_denoising.py --backend onnx --fp16``:
+
+    python convert_cntk_to_onnx.py --fp16
+
+Both CNTK and ONNX Runtime must be installed to run this script, and creating
+FP16 versions additionally requires the ``onnx`` package.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import argparse
+
+from cntk import ModelFormat
+
+import decode_model
+from decode_model_onnx import get_onnx_model_path
+
+
+def convert_model(model_select='400h', stage_select=3, fp16=False):
+    """Export pre-trained model to ONNX.
+
+    Parameters
+    ----------
+    model_select : str, optional
+        Which pre-trained model to export: "400h" or "1000h".
+        (Default: "400h")
+
+    stage_select : int, optional
+        Which stage of the PL based model to export outputs of. Only used by
+        the "1000h" model.
+        (Default: 3)
+
+    fp16 : bool, optional
+        If True, also create an FP16 version of the export, in which both
+        weights and activations are FP16.
+        (Default: False)
+
+    Returns
+    -------
+    onnxfs : list of str
+        Paths to exported models.
+    """
+    model = decode_model.load_model(
+        use_gpu=False, mode=3, model_select=model_select,
+        stage_select=stage_select)
+    onnxf = get_onnx_model_path(model_select, stage_select)
+    model.save(onnxf, format=ModelFormat.ONNX)
+    onnxfs = [onnxf]
+    if fp16:
+        import onnx
+        from onnxruntime.transformers.float16 import convert_float_to_float16
+        onnxf_fp16 = get_onnx_model_path(model_select, stage_select, fp16=True)
+        onnx.save(convert_float_to_float16(onnx.load(onnxf)), onnxf_fp16)
+        onnxfs.append(onnxf_fp16)
+    return onnxfs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export pre-trained enhancement models to ONNX.',
+        add_help=True)
+    parser.add_argument(
+        '--model_select', nargs='+', default=['400h', '1000h'],
+        choices=['400h', '1000h'], help='models to export')
+    parser.add_argument(
+        '--stage_select', nargs='+', default=[1, 2, 3], type=int,
+        choices=[1, 2, 3],
+        help='stages of the "1000h" model to export')
+    parser.add_argument(
+        '--fp16', default=False, action='store_true',
+        help='also create FP16 versions of exports')
+    args = parser.parse_args()
+    for model_select in args.model_select:
+        stages = args.stage_select if model_select == '1000h' else [3]
+        for stage_select in stages:
+            for onnxf in convert_model(model_select, stage_select, args.fp16):
+                print('Exported %s model to "%s".' % (model_select, onnxf))
+
+
+if __name__ == '__main__':
+    main()
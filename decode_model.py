@@ -8,10 +8,7 @@ Challenge." Proceedings of INTERSPEECH 2019. 2793-2797.
 from __future__ import print_function
 from __future__ import unicode_literals
 import os
-import re
-import sys
 import warnings
-import utils
 warnings.filterwarnings(
     'ignore', message=r'[\s\S]+Missing optional dependency')
 warnings.filterwarnings(
@@ -21,36 +18,25 @@ warnings.filterwarnings(
 warnings.filterwarnings(
     'ignore', message='Insufficiently recent colorama version found')
 
-from cntk.io import MinibatchSource, HTKFeatureDeserializer, StreamDef, StreamDefs
-from cntk import load_model, combine
+from cntk import load_model as load_cntk_model
+from cntk import combine
 from cntk.device import try_set_default_device, gpu, cpu
 import numpy as np
-import scipy.io as sio
 import wurlitzer
 import pdb
 
+import utils
+
 HERE = os.path.abspath(os.path.dirname(__file__))
 #MODELF = os.path.join(HERE, "model", "speech_enhancement.model")
-PY2 = sys.version_info[0] == 2
 
 
-def decode_model(features_file, irm_mat_dir, feature_dim, use_gpu=True,
-                 gpu_id=0, mode=1, model_select='400h', stage_select=3):
-    """Applies model to LPS features to generate ideal ratio mask.
+def load_model(use_gpu=True, gpu_id=0, mode=3, model_select='400h',
+               stage_select=3):
+    """Load pre-trained enhancement model.
 
     Parameters
     ----------
-    features_file : str
-        Path to HTK script file for chunks of LPS features to be processed.
-
-    irm_mat_dir : str
-        Path to output directory for ``.mat`` files containing ideal ratio
-        masks.
-
-    feature_dim : int
-        Feature dimensionality. Needed to parse HTK binary file containing
-        features.
-
     use_gpu : bool, optional
         If True and GPU is available, perform all processing on GPU.
         (Default: True)
@@ -58,69 +44,133 @@ def decode_model(features_file, irm_mat_dir, feature_dim, use_gpu=True,
     gpu_id : int, optional
          Id of GPU on which to do computation.
          (Default: 0)
-    """
-    if not os.path.exists(irm_mat_dir):
-        os.makedirs(irm_mat_dir)
-    
-    model_select=str(model_select)
 
-    # Load model.
+    mode : int, optional
+        Which outputs of the model will be used: 1 for the IRM, 2 for the LPS,
+        and 3 for both. Outputs that are not used are not computed.
+        (Default: 3)
+
+    model_select : str, optional
+        Which pre-trained model to use: "400h" or "1000h".
+        (Default: "400h")
+
+    stage_select : int, optional
+        Which stage of the PL based model to take outputs from. Only used by
+        the "1000h" model.
+        (Default: 3)
+
+    Returns
+    -------
+    model : cntk.Function
+        Function whose outputs are the estimated IRM and/or LPS, in that order.
+    """
+    model_select = str(model_select).lower()
+    if model_select == '400h':
+        irm_name, lps_name = 'irm', 'lps'
+    elif model_select == '1000h':
+        irm_name, lps_name = 'irm_s%d' % stage_select, 'lps_s%d' % stage_select
+    else:
+        raise ValueError('Invalid parameter of model_select: "%s".' % model_select)
+    node_names = []
+    if mode in (1, 3):
+        node_names.append(irm_name)
+    if mode in (2, 3):
+        node_names.append(lps_name)
+    if not node_names:
+        raise ValueError('Invalid parameter of mode: "%s".' % mode)
+    modelf = os.path.join(
+        HERE, 'model', 'speech_enhancement_%s.model' % model_select)
     with wurlitzer.pipes() as (stdout, stderr):
         try_set_default_device(gpu(gpu_id) if use_gpu else cpu())
-        
-        if model_select.lower() =='400h':
-            MODELF = os.path.join(HERE, "model", "speech_enhancement_400h.model")
-            model_dnn = load_model(MODELF)
-        elif model_select.lower() =='1000h':
-            MODELF = os.path.join(HERE, "model", "speech_enhancement_1000h.model")
-            model_dnn = load_model(MODELF)
-
-    # Compute ideal ratio masks for all chunks of LPS features specified in
-    # the script file and save as .mat files in irm_mat_dir.
+        model_dnn = load_cntk_model(modelf)
+    return combine([model_dnn.find_by_name(node_name).owner
+                    for node_name in node_names])
+
+
+def infer(model, features, mode=3):
+    """Apply model to LPS features to estimate IRM and LPS.
+
+    All arrays of features are decoded together as one minibatch of sequences
+    and both outputs are computed in a single forward pass.
+
+    Parameters
+    ----------
+    model : cntk.Function
+        Model as returned by ``load_model``.
+
+    features : list of ndarray, (n_frames, feature_dim)
+        LPS features for each sequence. Sequences may differ in length.
+
+    mode : int, optional
+        Mode ``model`` was loaded with.
+        (Default: 3)
+
+    Returns
+    -------
+    irms : list of ndarray, (n_frames, feature_dim)
+        Estimated ideal ratio mask for each sequence. Entries are None if
+        ``mode`` is 2.
+
+    lpss : list of ndarray, (n_frames, feature_dim)
+        Estimated LPS features for each sequence. Entries are None if ``mode``
+        is 1.
+    """
+    features = [utils.add_context(x.astype(np.float32, copy=False))
+                for x in features]
     with wurlitzer.pipes() as (stdout, stderr):
-        test_reader = MinibatchSource(
-            HTKFeatureDeserializer(StreamDefs(
-                amazing_features=StreamDef(shape=feature_dim, context=(3, 3),
-                                           scp=features_file))),
-            randomize=False, frame_mode=False, trace_level=0)
-    eval_input_map = {input: test_reader.streams.amazing_features}
-    with open(features_file, 'r') as f:
-        for line in f:
-            # Parse line of script file to get id for chunk and location of
-            # corresponding LPS features. Each line has the format:
-            #
-            #     {CHUNK_ID}={PATH_TO_HTK_BIN}[{START_FRAME_INDEX},{END_FRAME_INDEX}]
-            line = line.strip()
-            chunk_id, htk_bin_path, start_ind, end_ind = re.match(
-                r'(\S+)=(\S+)\[(\d+),(\d+)\]$', line).groups()
-            start_ind = int(start_ind)
-            end_ind = int(end_ind)
-            mb_size = end_ind - start_ind + 1
-
-            # Determine IRM features for frames in chunk.
-            noisy_fea = test_reader.next_minibatch(
-                mb_size, input_map=eval_input_map)
-            real_noisy_fea = noisy_fea[input].data
-            
-            
-            if model_select.lower() =='400h':
-                node_names = [b'irm' if PY2 else 'irm', b'lps' if PY2 else 'lps']
-            elif model_select.lower() =='1000h':
-                node_names = [b'irm_s'+str(stage_select) if PY2 else 'irm_s'+str(stage_select), b'lps_s'+str(stage_select) if PY2 else 'lps_s'+str(stage_select)]
-            else:
-                utils.error('Invalid parameter of model_select!!!!!')
-                
-            outputs_dict = {}
-            for node_name in  node_names:
-                node_in_graph = model_dnn.find_by_name(node_name)
-                output_nodes = combine([node_in_graph.owner])
-                with wurlitzer.pipes() as (stdout, stderr):
-                    value = output_nodes.eval(real_noisy_fea)
-                value = np.concatenate((value), axis=0)
-                outputs_dict[node_name] = value
-            
-            if model_select.lower() =='400h':
-                sio.savemat(os.path.join(irm_mat_dir, chunk_id + '.mat'), {'IRM' : outputs_dict['irm'], 'LPS':outputs_dict['lps']})
-            elif model_select.lower() =='1000h':
-                sio.savemat(os.path.join(irm_mat_dir, chunk_id + '.mat'), {'IRM' : outputs_dict['irm_s'+str(stage_select)], 'LPS':outputs_dict['lps_s'+str(stage_select)]})
+        values = model.eval({model.arguments[0]: features})
+    if len(model.outputs) == 1:
+        values = {model.outputs[0]: values}
+    outputs = iter([[np.asarray(x) for x in values[output]]
+                    for output in model.outputs])
+    no_outputs = [None]*len(features)
+    irms = next(outputs) if mode in (1, 3) else no_outputs
+    lpss = next(outputs) if mode in (2, 3) else no_outputs
+    return irms, lpss
+
+
+def decode_model(features, use_gpu=True, gpu_id=0, mode=3, model_select='400h',
+                 stage_select=3):
+    """Applies model to LPS features to generate ideal ratio mask.
+
+    Loads the model on every call; to process many arrays of features, use
+    ``load_model`` and ``infer`` directly.
 
+    Parameters
+    ----------
+    features : ndarray, (n_frames, feature_dim)
+        LPS features.
+
+    use_gpu : bool, optional
+        If True and GPU is available, perform all processing on GPU.
+        (Default: True)
+
+    gpu_id : int, optional
+         Id of GPU on which to do computation.
+         (Default: 0)
+
+    mode : int, optional
+        Which outputs of the model will be used: 1 for the IRM, 2 for the LPS,
+        and 3 for both. Outputs that are not used are not computed.
+        (Default: 3)
+
+    model_select : str, optional
+        Which pre-trained model to use: "400h" or "1000h".
+        (Default: "400h")
+
+    stage_select : int, optional
+        Which stage of the PL based model to take outputs from. Only used by
+        the "1000h" model.
+        (Default: 3)
+
+    Returns
+    -------
+    irm : ndarray, (n_frames, feature_dim)
+        Estimated ideal ratio mask. None if ``mode`` is 2.
+
+    lps : ndarray, (n_frames, feature_dim)
+        Estimated LPS features. None if ``mode`` is 1.
+    """
+    model = load_model(use_gpu, gpu_id, mode, model_select, stage_select)
+    irms, lpss = infer(model, [features], mode)
+    return irms[0], lpss[0]
@@ -0,0 +1,188 @@
+"""Functions for deriving ideal ratio masks using ONNX Runtime.
+
+These mirror ``load_model`` and ``infer`` from ``decode_model``, but apply ONNX
+exports of the pre-trained models using ONNX Runtime instead of CNTK. The
+models must first be exported using ``convert_cntk_to_onnx.py``.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+
+import numpy as np
+import onnxruntime as ort
+
+import utils
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+
+def get_onnx_model_path(model_select='400h', stage_select=3, fp16=False):
+    """Return path to ONNX export of pre-trained model.
+
+    Exports only contain the outputs of a single stage, so for the "1000h"
+    model there is one export per stage. If ``fp16`` is True, return the path
+    to the FP16 version of the export.
+    """
+    model_select = str(model_select).lower()
+    if model_select == '400h':
+        bn = 'speech_enhancement_400h'
+    elif model_select == '1000h':
+        bn = 'speech_enhancement_1000h_s%d' % stage_select
+    else:
+        raise ValueError('Invalid parameter of model_select: "%s".' % model_select)
+    ext = '.fp16.onnx' if fp16 else '.onnx'
+    return os.path.join(HERE, 'model', bn + ext)
+
+
+class ONNXModel(object):
+    """Pre-trained enhancement model loaded into ONNX Runtime.
+
+    On the GPU, inputs are copied into a device-resident buffer that is reused
+    from call to call and outputs are bound to device memory, so that the only
+    host/device transfers are a single copy in and a single copy out per call.
+    """
+    def __init__(self, sess, use_gpu=True, gpu_id=0):
+        self.sess = sess
+        self.use_gpu = use_gpu
+        self.gpu_id = gpu_id
+        self.input_name = sess.get_inputs()[0].name
+        self.input_dtype = (
+            np.float16 if sess.get_inputs()[0].type == 'tensor(float16)' else
+            np.float32)
+        self.output_names = [output.name for output in sess.get_outputs()]
+        self._io_binding = sess.io_binding()
+        self._input = None # Device-resident input buffer.
+
+    def run(self, x, output_names):
+        """Return values of outputs ``output_names`` for input ``x``."""
+        if not self.use_gpu:
+            return self.sess.run(output_names, {self.input_name: x})
+        if self._input is None or self._input.shape() != list(x.shape):
+            self._input = ort.OrtValue.ortvalue_from_numpy(
+                x, 'cuda', self.gpu_id)
+        else:
+            self._input.update_inplace(x)
+        io_binding = self._io_binding
+        io_binding.clear_binding_inputs()
+        io_binding.clear_binding_outputs()
+        io_binding.bind_ortvalue_input(self.input_name, self._input)
+        for output_name in output_names:
+            io_binding.bind_output(output_name, 'cuda', self.gpu_id)
+        self.sess.run_with_iobinding(io_binding)
+        return io_binding.copy_outputs_to_cpu()
+
+
+def load_model(use_gpu=True, gpu_id=0, mode=3, model_select='400h',
+               stage_select=3, fp16=False):
+    """Load ONNX export of pre-trained enhancement model.
+
+    Parameters
+    ----------
+    use_gpu : bool, optional
+        If True and GPU is available, perform all processing on GPU.
+        (Default: True)
+
+    gpu_id : int, optional
+         Id of GPU on which to do computation.
+         (Default: 0)
+
+    mode : int, optional
+        Which outputs of the model will be used: 1 for the IRM, 2 for the LPS,
+        and 3 for both. Outputs that are not used are not computed.
+        (Default: 3)
+
+    model_select : str, optional
+        Which pre-trained model to use: "400h" or "1000h".
+        (Default: "400h")
+
+    stage_select : int, optional
+        Which stage of the PL based model to take outputs from. Only used by
+        the "1000h" model.
+        (Default: 3)
+
+    fp16 : bool, optional
+        If True, load the FP16 version of the export, which is considerably
+        faster on GPUs with tensor cores.
+        (Default: False)
+
+    Returns
+    -------
+    model : ONNXModel
+        Model whose outputs are the estimated IRM and LPS, in that order.
+    """
+    if mode not in (1, 2, 3):
+        raise ValueError('Invalid parameter of mode: "%s".' % mode)
+    modelf = get_onnx_model_path(model_select, stage_select, fp16)
+    if not os.path.exists(modelf):
+        raise IOError('ONNX model "%s" does not exist. Export it using '
+                      'convert_cntk_to_onnx.py%s.' %
+                      (modelf, ' --fp16' if fp16 else ''))
+    if use_gpu:
+        providers = [('CUDAExecutionProvider', {'device_id': gpu_id})]
+    else:
+        providers = ['CPUExecutionProvider']
+    sess = ort.InferenceSession(modelf, providers=providers)
+    return ONNXModel(sess, use_gpu, gpu_id)
+
+
+def infer(model, features, mode=3):
+    """Apply model to LPS features to estimate IRM and LPS.
+
+    ONNX has no notion of variable-length sequences, so sequences of equal
+    length are decoded together as one minibatch. Chunks carry context from
+    their neighbors on either side, so the first and last chunk of a file
+    usually differ in length from those in between, and a batch of chunks is
+    decoded as up to three minibatches.
+
+    For FP16 models, features are cast to FP16 just before decoding and the
+    estimates are returned in FP32.
+
+    Parameters
+    ----------
+    model : ONNXModel
+        Model as returned by ``load_model``.
+
+    features : list of ndarray, (n_frames, feature_dim)
+        LPS features for each sequence. Sequences may differ in length.
+
+    mode : int, optional
+        Which outputs to compute: 1 for the IRM, 2 for the LPS, and 3 for both.
+        (Default: 3)
+
+    Returns
+    -------
+    irms : list of ndarray, (n_frames, feature_dim)
+        Estimated ideal ratio mask for each sequence. Entries are None if
+        ``mode`` is 2.
+
+    lpss : list of ndarray, (n_frames, feature_dim)
+        Estimated LPS features for each sequence. Entries are None if ``mode``
+        is 1.
+    """
+    features = [utils.add_context(x.astype(np.float32, copy=False))
+                for x in features]
+    irm_name, lps_name = model.output_names
+    output_names = []
+    if mode in (1, 3):
+        output_names.append(irm_name)
+    if mode in (2, 3):
+        output_names.append(lps_name)
+    irms = [None]*len(features)
+    lpss = [None]*len(features)
+    inds_by_length = {}
+    for ind, x in enumerate(features):
+        inds_by_length.setdefault(x.shape[0], []).append(ind)
+    for inds in inds_by_length.values():
+        # Exported models take input of shape (n_frames, batch_size,
+        # feature_dim).
+        x = np.stack([features[ind] for ind in inds], axis=1)
+        x = x.astype(model.input_dtype, copy=False)
+        values = iter(model.run(x, output_names))
+        for outputs, output_name in zip((irms, lpss), (irm_name, lps_name)):
+            if output_name not in output_names:
+                continue
+            value = next(values)
+            for j, ind in enumerate(inds):
+                outputs[ind] = np.ascontiguousarray(
+                    value[:, j], dtype=np.float32)
+    return irms, lpss
@@ -0,0 +1,252 @@
+"""Signal processing kernels for speech enhancement.
+
+Kept apart from ``utils`` as they require Numba and pyFFTW, which the VAD
+script does not.
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import multiprocessing
+import threading
+
+import numba
+import numpy as np
+import pyfftw
+
+from utils import EPS
+
+# FFTs are computed using FFTW, transforming blocks of FFT_BLOCK_SIZE frames at
+# a time so that a single measured plan serves signals of any length.
+FFT_THREADS = multiprocessing.cpu_count() # Number of threads used by FFTW.
+NUMBA_THREADS = numba.config.NUMBA_NUM_THREADS # Threads used by parallel kernels.
+FFT_PLANNER_EFFORT = 'FFTW_MEASURE'
+FFT_BLOCK_SIZE = 256 # Number of frames transformed by each FFTW call.
+
+
+def set_num_threads(n_threads):
+    """Set number of threads used by each FFT and parallel kernel."""
+    global FFT_THREADS, NUMBA_THREADS
+    FFT_THREADS = n_threads
+    NUMBA_THREADS = min(n_threads, numba.config.NUMBA_NUM_THREADS)
+
+
+def n_stft_frames(n_samps, n_per_seg=512, noverlap=256):
+    """Return number of frames in STFT of signal of ``n_samps`` samples."""
+    hop_size = n_per_seg - noverlap
+    nadd = noverlap - (n_samps - n_per_seg) % noverlap
+    return (n_samps + nadd - noverlap) // hop_size
+
+
+_FFT_PLANS = threading.local()
+def _get_fft_plan(n_per_seg, inverse=False):
+    """Return FFTW plan for real FFTs of ``FFT_BLOCK_SIZE`` frames.
+
+    Plans are created once per thread, as the input/output arrays they own
+    may not be shared between threads, and reused for all subsequent
+    transforms. Blocks of fewer frames are transformed with the same plan,
+    ignoring the surplus rows.
+    """
+    plans = _FFT_PLANS.__dict__
+    key = (n_per_seg, inverse, FFT_THREADS)
+    if key not in plans:
+        real = pyfftw.empty_aligned(
+            (FFT_BLOCK_SIZE, n_per_seg), dtype='float32')
+        real[...] = 0
+        cplx = pyfftw.empty_aligned(
+            (FFT_BLOCK_SIZE, n_per_seg//2 + 1), dtype='complex64')
+        cplx[...] = 0
+        if inverse:
+            plans[key] = pyfftw.FFTW(
+                cplx, real, direction='FFTW_BACKWARD',
+                flags=(FFT_PLANNER_EFFORT,), threads=FFT_THREADS)
+        else:
+            plans[key] = pyfftw.FFTW(
+                real, cplx, flags=(FFT_PLANNER_EFFORT,), threads=FFT_THREADS)
+    return plans[key]
+
+
+HAMMING_WINDOW = np.hamming(512).astype(np.float32) # Default analysis window.
+def stft(x, window=HAMMING_WINDOW, n_per_seg=512, noverlap=256):
+    """Return short-time Fourier transform (STFT) for signal.
+
+    The STFT is computed in single precision, the precision of the
+    enhancement models, and so is returned as complex64. The signal is
+    zero-padded at the end to ``n_stft_frames(len(x), n_per_seg, noverlap)``
+    frames.
+
+    Parameters
+    ----------
+    x : ndarray, (n_samps,)
+        Input signal.
+
+    window : ndarray, (wl,)
+        Array of weights to use when windowing the signal.
+
+    n_per_seg : int, optional
+    """
+    if len(window) != n_per_seg:
+        raise ValueError('window length must equal n_per_seg')
+    x = np.asarray(x, dtype=np.float32)
+    window = np.asarray(window, dtype=np.float32)
+    hop_size = n_per_seg - noverlap
+    n_frames = n_stft_frames(len(x), n_per_seg, noverlap)
+    nadd = (n_frames - 1)*hop_size + n_per_seg - len(x)
+    x = np.concatenate((x, np.zeros(nadd, dtype=np.float32)))
+    shape = x.shape[:-1] + (n_frames, n_per_seg)
+    strides = x.strides[:-1] + (hop_size * x.strides[-1], x.strides[-1])
+    x = np.lib.stride_tricks.as_strided(x, shape=shape, strides=strides)
+    plan = _get_fft_plan(n_per_seg)
+    result = np.empty((n_frames, n_per_seg//2 + 1), dtype=np.complex64)
+    for bi in range(0, n_frames, FFT_BLOCK_SIZE):
+        n = min(FFT_BLOCK_SIZE, n_frames - bi)
+        np.multiply(x[bi:bi + n], window, out=plan.input_array[:n])
+        plan()
+        result[bi:bi + n] = plan.output_array[:n]
+    return result
+
+
+def stft2logspec(y):
+    """Return log-power spectrum for STFT ``y``."""
+    return np.log(np.square(abs(y)) + EPS)
+
+
+def wav2logspec(x, window=HAMMING_WINDOW, n_per_seg=512, noverlap=256):
+    """TODO"""
+    y = stft(x, window, n_per_seg=n_per_seg, noverlap=noverlap)
+    return stft2logspec(y)
+
+
+
+@numba.njit(parallel=True, fastmath=True, cache=True, nogil=True)
+def _overlap_add(frames, c1, c2, c3, out):
+    """Overlap-add frames with 50% overlap, normalizing by the window weights.
+
+    The first ``len(out)`` samples are rounded, clipped to the range of 16-bit
+    PCM, and written to ``out``. Output is computed in blocks of half a frame,
+    each of which is written by exactly one iteration, so that blocks may be
+    computed in parallel.
+    """
+    n_frames, n_per_seg = frames.shape
+    hop_size = n_per_seg // 2
+    n_samps = out.shape[0]
+    for k in numba.prange(n_frames + 1):
+        offset = k*hop_size
+        for j in range(min(hop_size, n_samps - offset)):
+            if k == 0:
+                val = frames[0, j] / c1[j]
+            elif k == n_frames:
+                val = frames[k-1, hop_size + j] / c3
+            else:
+                # Second half of previous frame plus first half of this one.
+                val = (frames[k-1, hop_size + j] + frames[k, j]) / c2[j]
+            out[offset + j] = min(max(np.rint(val), -32768.0), 32767.0)
+
+
+_COLA_NORMS = {}
+def _get_cola_norms(window, hop_size):
+    """Return window weights used to normalize overlap-added frames.
+
+    The weights only depend on the window and hop size, so are computed once
+    for each pair and then reused.
+    """
+    key = (window.tobytes(), hop_size)
+    if key not in _COLA_NORMS:
+        c1 = np.ascontiguousarray(window[:hop_size])
+        c2 = window[hop_size:] + window[:hop_size]
+        c3 = window[hop_size]
+        _COLA_NORMS[key] = (c1, c2, c3)
+    return _COLA_NORMS[key]
+
+
+def logspec2wav(lps, ref_wav, window=HAMMING_WINDOW, n_per_seg=512,
+                noverlap=256, ref_stft=None):
+    """Convert log-power spectrum back to time domain.
+
+    The phase is taken from the STFT of ``ref_wav``. If the STFT is already
+    known, e.g. from feature extraction, it may be passed as ``ref_stft`` to
+    avoid recomputing it.
+
+    The waveform is returned as 16-bit PCM, rounded and clipped, and is the
+    same length as ``ref_wav``.
+    """
+    hop_size = n_per_seg - noverlap
+    assert len(window) % hop_size == 0, "The constraint of “Constant OverLap Add” (COLA) is not satisfied!"
+    if hop_size != noverlap:
+        raise ValueError('noverlap must equal n_per_seg // 2')
+    window = np.asarray(window, dtype=np.float32)
+    if ref_stft is None:
+        ref_stft = stft(ref_wav, window, n_per_seg=n_per_seg, noverlap=noverlap)
+    angle=ref_stft/ (np.abs(ref_stft) + EPS ) # Recover phase information
+    mag_x=np.sqrt(np.exp(lps))* angle
+    plan = _get_fft_plan(n_per_seg, inverse=True)
+    n_frames = mag_x.shape[0]
+    frames = np.empty((n_frames, n_per_seg), dtype=np.float32)
+    for bi in range(0, n_frames, FFT_BLOCK_SIZE):
+        n = min(FFT_BLOCK_SIZE, n_frames - bi)
+        plan.input_array[:n] = mag_x[bi:bi + n]
+        plan()
+        frames[bi:bi + n] = plan.output_array[:n]
+    C1, C2, C3 = _get_cola_norms(window, hop_size)
+    out = np.empty(len(ref_wav), dtype=np.int16)
+    # numba's thread count is per calling thread, so set it on each call.
+    # numba < 0.49 cannot set it at all, so there the kernel uses all of
+    # numba's threads (see NUMBA_NUM_THREADS).
+    if hasattr(numba, 'set_num_threads'):
+        numba.set_num_threads(NUMBA_THREADS)
+    _overlap_add(frames, C1, C2, C3, out)
+    return out
+
+
+MAX_PCM_VAL = 32767
+# The peak kernels are serial: they are memory-bound, and run concurrently with
+# the parallel overlap-add kernel during denoising, which is only safe with
+# some of numba's threading layers.
+@numba.njit(cache=True, nogil=True)
+def _get_peak(x):
+    """Return peak absolute value of 1-D integer signal in a single pass."""
+    lo = 0
+    hi = 0
+    for i in range(x.shape[0]):
+        val = np.int64(x[i])
+        lo = min(lo, val)
+        hi = max(hi, val)
+    return max(-lo, hi)
+
+
+def get_peak(x):
+    """Return peak absolute value of signal.
+
+    Does not create any temporary arrays, so is safe to use on memory-mapped
+    signals. For integer signals, the peak is found in a single pass.
+    """
+    x = np.asarray(x)
+    if x.dtype.kind in 'iu':
+        return float(_get_peak(x.reshape(-1)))
+    return max(abs(float(x.max())), abs(float(x.min())))
+
+
+@numba.njit(cache=True, nogil=True)
+def _peak_normalization(x, peak, out):
+    """Scale ``x`` so that ``peak`` maps to ``MAX_PCM_VAL``, truncating."""
+    for i in range(x.shape[0]):
+        out[i] = np.trunc(np.float64(x[i]) / peak * MAX_PCM_VAL)
+
+
+def peak_normalization(x, peak=None):
+    """Perform peak normalization.
+
+    If ``peak`` is None, the peak of ``x`` is used. To normalize chunks of a
+    longer signal consistently, pass the peak of the full signal.
+
+    Samples are scaled and truncated to integer values in a single pass and
+    returned as float32, the precision of feature extraction.
+    """
+    x = np.asarray(x)
+    if peak is None:
+        peak = get_peak(x)
+    out = np.empty(x.shape, dtype=np.float32)
+    if x.size:
+        if peak == 0:
+            out[...] = 0
+        else:
+            _peak_normalization(x.reshape(-1), float(peak), out.reshape(-1))
+    return out
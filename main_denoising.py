@@ -42,6 +42,35 @@ memory footprint. For instance:
 will perform enhancement on the GPU using chunks that are 10 minutes in duration. This should use at
 most 8 GB of GPU memory.
 
+By default each chunk is sent to the model on its own. As the model is an LSTM, the GPU is better
+utilized by decoding several shorter chunks together, which may be done via the ``--batch_minutes``
+flag controlling the total duration of the chunks decoded at once. GPU memory use is governed by
+``--batch_minutes`` in the same way it is by ``--truncate_minutes``, so that:
+
+   python main_denoising.py --truncate_minutes 1 --batch_minutes 10 --use_gpu true --gpu_id 0 -S some.scp --output_dir se_wav_dir/
+
+will decode ten 1 minute chunks at a time within roughly the same memory budget as above.
+
+When processing large batches of audio, feature extraction and waveform reconstruction may be
+parallelized across files by specifying the number of parallel processes to employ via the
+``--n_jobs`` flag:
+
+   python main_denoising.py --n_jobs 4 --use_gpu true --gpu_id 0 -S some.scp --output_dir se_wav_dir/
+
+When using a GPU, all processes share a single copy of the model; otherwise, each process loads its
+own copy.
+
+The model may alternately be applied using ONNX Runtime, which is typically faster than CNTK, via the
+``--backend`` flag. This requires ONNX exports of the pre-trained models, which may be created by
+running ``convert_cntk_to_onnx.py`` once:
+
+   python convert_cntk_to_onnx.py
+   python main_denoising.py --backend onnx --use_gpu true --gpu_id 0 -S some.scp --output_dir se_wav_dir/
+
+On GPUs with tensor cores, the ONNX backend is considerably faster still when run in FP16, which
+requires FP16 versions of the exports (created by ``convert_cntk_to_onnx.py --fp16``) and is enabled
+via the ``--fp16`` flag.
+
 References
 ----------
 - Sun, Lei, et al. (2018). "Speaker diarization with enhancing speech for the First DIHARD
@@ -56,19 +85,19 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 import argparse
-import math
+from concurrent.futures import ThreadPoolExecutor, wait
 import multiprocessing
 import os
-import shutil
+import queue
 import sys
-import tempfile
 import traceback
 
+import numexpr as ne
 import numpy as np
 import scipy.io.wavfile as wav_io
 import scipy.io as sio
 
-from decode_model import decode_model
+import dsp
 import utils
 
 HERE = os.path.abspath(os.path.dirname(__file__))
@@ -80,33 +109,116 @@ NUM_CHANNELS = 1 # Expected number of channels of input WAV.
 BITDEPTH = 16 # Expected bitdepth of input WAV.
 WL = 512 # Analysis window length in samples for feature extraction.
 WL2 = WL // 2
-NFREQS = 257 # Number of positive frequencies in FFT output.
-
-
-class Process(multiprocessing.Process):
-    """Subclass of ``Process`` that retains raised exceptions as an attribute."""
-    def __init__(self, *args, **kwargs):
-        multiprocessing.Process.__init__(self, *args, **kwargs)
-        self._pconn, self._cconn = multiprocessing.Pipe()
-        self._exception = None
+CHUNK_CONTEXT = WL - WL2 # Samples of context on either side of each chunk.
+
+
+class PersistentDecoder(multiprocessing.Process):
+    """Long-lived process that loads the enhancement model once and applies it.
+
+    The decoder serves ``n_clients`` clients, each of which sends requests via
+    the handle returned by ``client``. Requests are pairs ``(client_id,
+    features)`` put on ``in_q``, where ``features`` is a list of arrays of LPS
+    features. For each, a pair ``(outputs, exception)`` is put on
+    ``out_qs[client_id]``, where ``outputs`` is the tuple ``(irms, lpss)`` of
+    lists of estimates and ``exception`` is either ``None`` or a tuple of the
+    raised exception and its traceback. Putting ``None`` on ``in_q`` shuts the
+    process down.
+
+    CNTK leaks memory, so all CNTK work is confined to this process, which is
+    torn down once all files have been processed. As the model is only loaded
+    once, the CNTK/CUDA initialization cost is paid once per run rather than
+    once per chunk. The model is applied using CNTK if ``backend`` is "cntk"
+    and ONNX Runtime if it is "onnx", in which case it is run in FP16 if
+    ``fp16`` is True.
+    """
+    def __init__(self, use_gpu, gpu_id, mode, model_select, stage_select,
+                 n_clients=1, backend='cntk', fp16=False):
+        if backend not in ('cntk', 'onnx'):
+            raise ValueError('Invalid parameter of backend: "%s".' % backend)
+        if fp16 and backend != 'onnx':
+            raise ValueError('FP16 is only supported by the "onnx" backend.')
+        super(PersistentDecoder, self).__init__()
+        self.daemon = True
+        self.n_clients = n_clients
+        self.in_q = multiprocessing.Queue()
+        self.out_qs = [multiprocessing.Queue() for _ in range(n_clients)]
+        self._mode = mode
+        self._backend = backend
+        self._load_args = (use_gpu, gpu_id, mode, model_select, stage_select)
+        self._load_kwargs = dict(fp16=fp16) if backend == 'onnx' else {}
 
     def run(self):
+        # Import here so that CNTK is only ever initialized in this process.
+        if self._backend == 'onnx':
+            import decode_model_onnx as decode_model
+        else:
+            import decode_model
         try:
-            super(Process, self).run()
-            self._cconn.send(None)
+            model = decode_model.load_model(
+                *self._load_args, **self._load_kwargs)
+            load_exception = None
         except Exception as e:
-            tb = traceback.format_exc()
-            self._cconn.send((e, tb))
-
-    @property
-    def exception(self):
-        if self._pconn.poll():
-            self._exception = self._pconn.recv()
-        return self._exception
-
-
-def denoise_wav(src_wav_file, dest_wav_file, global_mean, global_var, use_gpu,
-                gpu_id, truncate_minutes, mode, model_select, stage_select):
+            load_exception = (e, traceback.format_exc())
+        while True:
+            request = self.in_q.get()
+            if request is None:
+                break
+            client_id, features = request
+            out_q = self.out_qs[client_id]
+            if load_exception is not None:
+                out_q.put((None, load_exception))
+                continue
+            try:
+                out_q.put(
+                    (decode_model.infer(model, features, self._mode), None))
+            except Exception as e:
+                out_q.put((None, (e, traceback.format_exc())))
+
+        # Clients that were terminated early may leave replies unread; don't
+        # block on flushing them at exit.
+        for out_q in self.out_qs:
+            out_q.cancel_join_thread()
+
+    def client(self, client_id):
+        """Return handle through which client ``client_id`` sends requests."""
+        return DecoderClient(self.in_q, self.out_qs[client_id], client_id)
+
+    def close(self):
+        """Shut down the decoder process."""
+        if self.is_alive():
+            self.in_q.put(None)
+        else:
+            # Nothing will ever read pending features, so don't block on
+            # flushing them at exit.
+            self.in_q.cancel_join_thread()
+        self.join()
+
+
+class DecoderClient(object):
+    """Handle through which a worker process sends features to a decoder."""
+    def __init__(self, in_q, out_q, client_id):
+        self.in_q = in_q
+        self.out_q = out_q
+        self.client_id = client_id
+
+    def decode(self, features):
+        """Return IRMs and LPS estimated by the model for list of LPS features."""
+        self.in_q.put((self.client_id, features))
+        outputs, exception = self.out_q.get()
+        if exception is not None:
+            e, tb = exception
+            raise type(e)(tb)
+        return outputs
+
+
+def get_tmp_wav_file(dest_wav_file):
+    """Return path of temporary file enhanced audio is written to."""
+    return dest_wav_file + '.tmp'
+
+
+def denoise_wav(src_wav_file, dest_wav_file, global_mean, global_var,
+                global_inv_var, decoder, truncate_minutes, mode, model_select,
+                batch_minutes=None, executors=None):
     """Apply speech enhancement to audio in WAV file.
 
     Parameters
@@ -123,22 +235,34 @@ def denoise_wav(src_wav_file, dest_wav_file, global_mean, global_var, use_gpu,
     global_var : ndarray, (n_feats,)
         Global variances for LPS features. Used for CMVN.
 
-    use_gpu : bool, optional
-        If True and GPU is available, perform all processing on GPU.
-        (Default: True)
+    global_inv_var : ndarray, (n_feats,)
+        Reciprocal of ``global_var``.
 
-    gpu_id : int, optional
-         Id of GPU on which to do computation.
-         (Default: 0)
+    decoder : DecoderClient
+        Handle to running decoder process used to apply the enhancement model.
 
     truncate_minutes: float
         Maximimize size in minutes to process at a time. The enhancement will
-        be done on chunks of audio no greather than ``truncate_minutes``
-        minutes duration.
+        be done on chunks of audio of roughly ``truncate_minutes`` minutes
+        duration, rounded down to a whole number of STFT hops. Any trailing
+        audio shorter than one analysis window is folded into the last chunk.
+
+    batch_minutes : float, optional
+        Maximum total duration in minutes of the chunks decoded together in a
+        single call to the model. If None, chunks are decoded one at a time.
+        (Default: None)
+
+    executors : tuple of ThreadPoolExecutor, optional
+        Pair of single-threaded executors on which to perform feature
+        extraction and reconstruction, respectively. Reusing them from file to
+        file lets their threads reuse their FFT plans. If None, executors are
+        created for this file alone.
+        (Default: None)
     """
     # Read noisy audio WAV file. As scipy.io.wavefile.read is FAR faster than
-    # librosa.load, we use the former.
-    rate, wav_data = wav_io.read(src_wav_file)
+    # librosa.load, we use the former. The file is memory-mapped so that only
+    # the chunks being processed are read into memory.
+    rate, wav_data = wav_io.read(src_wav_file, mmap=True)
 
     if mode == 1:
         print("###Selecting the estimated ideal-ratio-masks in mode 1 (more conservative).###")
@@ -149,100 +273,258 @@ def denoise_wav(src_wav_file, dest_wav_file, global_mean, global_var, use_gpu,
         
     print("Using the pre-trained {} speech enhancement model.".format(model_select))   
         
-    # Apply peak-normalization.
-    wav_data = utils.peak_normalization(wav_data)
-
-    # Perform denoising in chunks of size chunk_length samples.
-    chunk_length = int(truncate_minutes*rate*60)
-    total_chunks = int(
-        math.ceil(wav_data.size / chunk_length))
-    data_se = [] # Will hold enhanced audio data for each chunk.
-    for i in range(1, total_chunks + 1):
-        tmp_dir = tempfile.mkdtemp()
-        try:
-            # Get samples for this chunk.
-            bi = (i-1)*chunk_length # Index of first sample of this chunk.
-            ei = bi + chunk_length # Index of last sample of this chunk + 1.
-            temp = wav_data[bi:ei]
+    # Determine peak for peak-normalization, which is applied chunk by chunk.
+    peak = dsp.get_peak(wav_data)
+
+    # Perform denoising in chunks of size chunk_length samples, decoding
+    # chunks_per_batch chunks at a time. Chunks lie on the STFT frame grid and
+    # are extended by CHUNK_CONTEXT samples on either side, so that every
+    # sample of a chunk is covered by the same frames as it would be were the
+    # file processed whole; the context is discarded after reconstruction,
+    # leaving no overlap-add seams at chunk boundaries.
+    n_samples = wav_data.size
+    chunk_length = max(WL2, int(truncate_minutes*rate*60) // WL2 * WL2)
+    chunk_bis = list(range(0, n_samples, chunk_length))
+    if len(chunk_bis) > 1 and n_samples - chunk_bis[-1] < WL:
+        # Fold trailing audio too short to be worth decoding on its own into
+        # the previous chunk.
+        chunk_bis.pop()
+    chunk_eis = chunk_bis[1:] + [n_samples]
+    total_chunks = len(chunk_bis)
+    if batch_minutes is None:
+        chunks_per_batch = 1
+    else:
+        chunks_per_batch = max(1, int(batch_minutes*rate*60) // chunk_length)
+
+    def get_features(first):
+        """Return chunks of batch starting with chunk ``first`` and features."""
+        # Get bounds of chunks in this batch, including context.
+        bounds = [] # Indices of first/last + 1 samples of chunk and context.
+        for i in range(first, min(first + chunks_per_batch, total_chunks)):
+            bi = chunk_bis[i] # Index of first sample of this chunk.
+            ei = chunk_eis[i] # Index of last sample of this chunk + 1.
+            ci = max(0, bi - CHUNK_CONTEXT)
+            ce = min(n_samples, ei + CHUNK_CONTEXT)
+            bounds.append((bi, ei, ci, ce))
             print('Processing file: %s, segment: %d/%d.' %
-                  (src_wav_file, i, total_chunks))
-
-            # Skip denoising if chunk is too short.
+                  (src_wav_file, i + 1, total_chunks))
+
+        # Peak-normalize the samples spanned by the batch.
+        span_ci = bounds[0][2]
+        span_temp = dsp.peak_normalization(
+            wav_data[span_ci:bounds[-1][3]], peak)
+        temps = [span_temp[ci - span_ci:ce - span_ci]
+                 for _, _, ci, ce in bounds]
+        if span_temp.shape[0] < WL2:
+            # Too short to denoise.
+            return bounds, temps, [], [], []
+
+        # Extract LPS features for the whole span with a single STFT. As chunks
+        # start on the STFT frame grid, the frames of each chunk are a run of
+        # the frames of the span, differing at most in the final frame, which
+        # only covers context. The STFT is kept to supply the phase for
+        # reconstruction.
+        span_stft = dsp.stft(
+            span_temp, window=dsp.HAMMING_WINDOW, n_per_seg=WL,
+            noverlap=WL2)
+        span_htkdata = dsp.stft2logspec(span_stft)
+
+        # Do MVN before decoding. The 1000h model already integrates MVN
+        # inside itself. Features and MVN statistics are both float32, the
+        # precision the model works in, so no casts are needed.
+        if model_select.lower() == '400h':
+            span_features = (span_htkdata - global_mean) * global_inv_var
+        else:
+            span_features = span_htkdata
+
+        # Split into chunks.
+        stfts = []
+        noisy_htkdatas = []
+        features = []
+        for _, _, ci, ce in bounds:
+            fi = (ci - span_ci) // WL2
+            fe = fi + dsp.n_stft_frames(ce - ci, WL, WL2)
+            stfts.append(span_stft[fi:fe])
+            noisy_htkdatas.append(span_htkdata[fi:fe])
+            features.append(span_features[fi:fe])
+        return bounds, temps, stfts, noisy_htkdatas, features
+
+    def reconstruct(bounds, temps, stfts, noisy_htkdatas, irms, lpss):
+        """Write enhanced audio for chunks of batch to ``wav_f``."""
+        outputs = iter(zip(stfts, noisy_htkdatas, irms, lpss))
+        for (bi, ei, ci, _), temp in zip(bounds, temps):
             if temp.shape[0] < WL2:
-                data_se.append(temp)
+                temp[bi - ci:ei - ci].astype(np.int16).tofile(wav_f)
                 continue
-
-            # Determine paths to the temporary files to be created.
-            noisy_normed_lps_fn = os.path.join(
-                tmp_dir, 'noisy_normed_lps.htk')
-            noisy_normed_lps_scp_fn = os.path.join(
-                tmp_dir, 'noisy_normed_lps.scp')
-            outputs_fn = os.path.join(
-                tmp_dir, 'irm.mat')
-
-            # Extract LPS features from waveform.
-            noisy_htkdata = utils.wav2logspec(temp, window=np.hamming(WL))
-
-            # Do MVN before decoding.
-            normed_noisy = (noisy_htkdata - global_mean) / global_var
-               
-            # Write features to HTK binary format making sure to also
-            # create a script file.
-            #utils.write_htk(
-            #     noisy_normed_lps_fn, normed_noisy, samp_period=SR,
-            #    parm_kind=9)
-            
-            if model_select.lower() =='400h':
-                utils.write_htk( noisy_normed_lps_fn, normed_noisy, samp_period=SR, parm_kind=9)
-            elif model_select.lower() =='1000h': 
-                utils.write_htk( noisy_normed_lps_fn, noisy_htkdata, samp_period=SR, parm_kind=9) ### The 1000h model already integrates MVN inside itself.
-
-            cntk_len = noisy_htkdata.shape[0] - 1
-            with open(noisy_normed_lps_scp_fn, 'w') as f:
-                f.write('irm=%s[0,%d]\n' % (noisy_normed_lps_fn, cntk_len))
-
-            # Apply CNTK model to determine ideal ratio mask (IRM), which will
-            # be output to the temp directory as irm.mat. In order to avoid a
-            # memory leak, must do this in a separate process which we then
-            # kill.
-            #def decode_model(features_file, irm_mat_dir, feature_dim, use_gpu=True,
-             #                gpu_id=0, mode=1, model_select='400h', stage_select=3):
-            
-            p = Process(
-                target=decode_model,
-                args=(noisy_normed_lps_scp_fn, tmp_dir, NFREQS, use_gpu, gpu_id , mode, model_select, stage_select))
-            p.start()
-            p.join()
-            if p.exception:
-                e, tb = p.exception
-                raise type(e)(tb)
-
-            # Read in IRM and directly mask the original LPS features.
-            irm = sio.loadmat(outputs_fn)['IRM']
-            lps = sio.loadmat(outputs_fn)['LPS']
-
+            ref_stft, noisy_htkdata, irm, lps = next(outputs)
+
+            # Only the outputs used by this mode are computed by the model.
+            # Each formula is evaluated by numexpr in a single blocked pass
+            # without temporaries, writing into a model output that is not
+            # needed afterwards. The 0.5 is passed as float32 so that the
+            # evaluation stays in float32.
+            local_dict = dict(
+                noisy=noisy_htkdata, irm=irm, lps=lps, gvar=global_var,
+                gmean=global_mean, half=np.float32(0.5))
             if mode == 1:
-                recovered_lps = noisy_htkdata + np.log(irm)
+                recovered_lps = ne.evaluate(
+                    'noisy + log(irm)', local_dict=local_dict, out=irm)
             elif mode == 2:
-                recovered_lps = (lps * global_var) +  global_mean 
+                recovered_lps = ne.evaluate(
+                    'lps*gvar + gmean', local_dict=local_dict, out=lps)
             elif mode == 3:
-                recovered_lps = 0.5*( noisy_htkdata + np.log(irm)) + 0.5*((lps * global_var) +  global_mean)          
- 
-            # Reconstruct audio.
-            wave_recon = utils.logspec2wav(
-                recovered_lps, temp, window=np.hamming(WL), n_per_seg=WL,
-                noverlap=WL2)
-            data_se.append(wave_recon)
-        finally:
-            shutil.rmtree(tmp_dir)
-    data_se = [x.astype(np.int16, copy=False) for x in data_se]
-    data_se = np.concatenate(data_se)
-    wav_io.write(dest_wav_file, SR, data_se)
-
-
-def main_denoising(wav_files, output_dir, verbose, use_gpu, gpu_id, truncate_minutes, mode, model_select='1000h',stage_select=3):
+                recovered_lps = ne.evaluate(
+                    'half*(noisy + log(irm)) + half*(lps*gvar + gmean)',
+                    local_dict=local_dict, out=irm)
+
+            # Reconstruct audio and keep only the chunk itself.
+            wave_recon = dsp.logspec2wav(
+                recovered_lps, temp, window=dsp.HAMMING_WINDOW,
+                n_per_seg=WL, noverlap=WL2, ref_stft=ref_stft)
+            wave_recon[bi - ci:ei - ci].tofile(wav_f)
+
+    # Write enhanced audio to the output as each chunk is reconstructed. As
+    # chunks are reconstructed in order and the number of samples is known,
+    # the WAV header can be written up front. The output may be the input,
+    # which is memory-mapped, so write to a temporary file that replaces the
+    # output once complete.
+    tmp_wav_file = get_tmp_wav_file(dest_wav_file)
+    wav_f = utils.write_wav_prealloc(tmp_wav_file, SR, n_samples)
+
+    # Pipeline the batches so that feature extraction for the next batch and
+    # reconstruction of the previous batch overlap with decoding of the
+    # current one. The FFTs and overlap-add release the GIL, as does waiting
+    # on the decoder, so threads suffice.
+    own_executors = executors is None
+    if own_executors:
+        executors = (ThreadPoolExecutor(max_workers=1),
+                     ThreadPoolExecutor(max_workers=1))
+    feature_executor, recon_executor = executors
+    pending_features = None
+    pending_recon = None
+    try:
+        pending_features = feature_executor.submit(get_features, 0)
+        for first in range(0, total_chunks, chunks_per_batch):
+            (bounds, temps, stfts, noisy_htkdatas,
+             features) = pending_features.result()
+            if first + chunks_per_batch < total_chunks:
+                pending_features = feature_executor.submit(
+                    get_features, first + chunks_per_batch)
+
+            # Apply CNTK model to determine ideal ratio mask (IRM) and LPS
+            # for all chunks in the batch with a single call.
+            irms, lpss = decoder.decode(features) if features else ([], [])
+
+            # Wait for reconstruction of the previous batch so that at most
+            # one batch of spectrograms is awaiting reconstruction.
+            if pending_recon is not None:
+                pending_recon.result()
+            pending_recon = recon_executor.submit(
+                reconstruct, bounds, temps, stfts, noisy_htkdatas, irms, lpss)
+        pending_recon.result()
+        wav_f.close()
+        os.replace(tmp_wav_file, dest_wav_file)
+    except BaseException:
+        # Let work still in flight finish, as it may write to the output and
+        # would otherwise hold up the executors' next file.
+        wait([future for future in (pending_features, pending_recon)
+              if future is not None])
+        wav_f.close()
+        os.remove(tmp_wav_file)
+        raise
+    finally:
+        if own_executors:
+            for executor in executors:
+                executor.shutdown()
+
+
+def perform_denoising(kwargs, decoder, executors=None):
+    """Perform speech enhancement for WAV file using ``decoder``.
+
+    If an exception is raised during processing, it returns the exception as well as
+    the full traceback. Otherwise, returns ``None``.
+
+    Parameters
+    ----------
+    kwargs
+        Keyword arguments to pass to ``denoise_wav``.
+
+    decoder : DecoderClient
+        Handle to running decoder process used to apply the enhancement model.
+
+    executors : tuple of ThreadPoolExecutor, optional
+        Executors to pass to ``denoise_wav``.
+        (Default: None)
+    """
+    try:
+        denoise_wav(decoder=decoder, executors=executors, **kwargs)
+        return None
+    except Exception as e:
+        tb = traceback.format_exc()
+        return e, tb
+
+
+class DenoisingWorker(multiprocessing.Process):
+    """Worker process that denoises files using its own decoder client.
+
+    Jobs are pairs ``(job_id, kwargs)`` taken from ``job_q``, where ``kwargs``
+    are keyword arguments to pass to ``denoise_wav``. For each, the pair
+    ``(job_id, result)`` is put on ``result_q``, where ``result`` is as
+    returned by ``perform_denoising``. The worker exits upon taking ``None``
+    from ``job_q``.
+    """
+    def __init__(self, decoder, job_q, result_q, n_threads):
+        super(DenoisingWorker, self).__init__()
+        self.daemon = True
+        self.decoder = decoder
+        self.job_q = job_q
+        self.result_q = result_q
+        self._n_threads = n_threads
+
+    def run(self):
+        # Feature extraction and reconstruction run concurrently, so split
+        # the worker's threads between them. Only reconstruction uses numexpr
+        # and the parallel numba kernel.
+        n_threads = max(1, self._n_threads // 2)
+        dsp.set_num_threads(n_threads)
+        ne.set_num_threads(n_threads)
+        # Keep the same threads, and so the same FFT plans, for all files.
+        with ThreadPoolExecutor(max_workers=1) as feature_executor, \
+             ThreadPoolExecutor(max_workers=1) as recon_executor:
+            executors = (feature_executor, recon_executor)
+            while True:
+                job = self.job_q.get()
+                if job is None:
+                    break
+                job_id, kwargs = job
+                self.result_q.put(
+                    (job_id, perform_denoising(kwargs, self.decoder, executors)))
+
+
+def _next_result(result_q, decoders, workers):
+    """Return next result from ``result_q``, failing if any process has died.
+
+    Workers exit only once there are no jobs left, so a worker that exits
+    with a nonzero exit code has died, taking the result of its job with it.
+    """
+    while True:
+        try:
+            return result_q.get(timeout=1)
+        except queue.Empty:
+            if not all(decoder.is_alive() for decoder in decoders):
+                raise RuntimeError('Decoder process died unexpectedly.')
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                raise RuntimeError('Worker process died unexpectedly.')
+
+
+def main_denoising(wav_files, output_dir, verbose, use_gpu, gpu_id, truncate_minutes, mode, model_select='1000h',stage_select=3, batch_minutes=None, n_jobs=1, backend='cntk', fp16=False):
     """Perform speech enhancement for WAV files in ``wav_dir``.
 
+    Files are processed by ``n_jobs`` worker processes. When using the GPU, the
+    model is applied by a single decoder process shared by all workers, so that
+    feature extraction and reconstruction for some files overlap with decoding
+    of others. Otherwise, each worker has a decoder process of its own.
+
     Parameters
     ----------
     wav_files : list of str
@@ -254,6 +536,18 @@ def main_denoising(wav_files, output_dir, verbose, use_gpu, gpu_id, truncate_min
     verbose : bool, optional
         If True, print full stacktrace to STDERR for files with errors.
 
+    n_jobs : int, optional
+        Number of parallel worker processes.
+        (Default: 1)
+
+    backend : str, optional
+        Library used to apply the model: "cntk" or "onnx".
+        (Default: "cntk")
+
+    fp16 : bool, optional
+        If True, run the model in FP16. Only supported by the "onnx" backend.
+        (Default: False)
+
     kwargs
         Keyword arguments to pass to ``denoise_wav``.
     """
@@ -266,39 +560,105 @@ def main_denoising(wav_files, output_dir, verbose, use_gpu, gpu_id, truncate_min
     global_mean = global_mean_var['global_mean']
     global_var = global_mean_var['global_var']
 
-    # Perform speech enhancement.
+    # Store the statistics in float32, the precision the model works in, and
+    # precompute the reciprocal of the variances so that MVN multiplies
+    # rather than divides.
+    global_mean = np.ascontiguousarray(global_mean.astype(np.float32).ravel())
+    global_var = np.ascontiguousarray(global_var.astype(np.float32).ravel())
+    global_inv_var = 1 / global_var
+
+    # Determine files to denoise.
+    jobs = []
     for src_wav_file in wav_files:
         # Perform basic checks of input WAV.
         if not os.path.exists(src_wav_file):
             utils.error('File "%s" does not exist. Skipping.' % src_wav_file)
             continue
-        if not utils.is_wav(src_wav_file):
+        sr, num_channels, bitdepth, is_wav = utils.read_wav_header(
+            src_wav_file)
+        if not is_wav:
             utils.error('File "%s" is not WAV. Skipping.' % src_wav_file)
             continue
-        if utils.get_sr(src_wav_file) != SR:
+        if sr != SR:
             utils.error('Sample rate of file "%s" is not %d Hz. Skipping.' %
                         (src_wav_file, SR))
             continue
-        if utils.get_num_channels(src_wav_file) != NUM_CHANNELS:
+        if num_channels != NUM_CHANNELS:
             utils.error('File "%s" is not monochannel. Skipping.' % src_wav_file)
             continue
-        if utils.get_bitdepth(src_wav_file) != BITDEPTH:
+        if bitdepth != BITDEPTH:
             utils.error('Bitdepth of file "%s" is not %d. Skipping.' %
                         (src_wav_file, BITDEPTH))
             continue
-
-        # Denoise.
-        try:
-            bn = os.path.basename(src_wav_file)
-            dest_wav_file = os.path.join(output_dir, bn)
-            denoise_wav(src_wav_file, dest_wav_file, global_mean, global_var, use_gpu, gpu_id, truncate_minutes, mode, model_select, stage_select )
-            print('Finished processing file "%s".' % src_wav_file)
-        except Exception as e:
+        bn = os.path.basename(src_wav_file)
+        dest_wav_file = os.path.join(output_dir, bn)
+        jobs.append(dict(
+            src_wav_file=src_wav_file, dest_wav_file=dest_wav_file,
+            global_mean=global_mean, global_var=global_var,
+            global_inv_var=global_inv_var,
+            truncate_minutes=truncate_minutes, mode=mode,
+            model_select=model_select, batch_minutes=batch_minutes))
+    if not jobs:
+        return
+
+    # Start decoder processes, which load the model once for all files.
+    n_jobs = max(1, min(n_jobs, len(jobs)))
+    if use_gpu:
+        decoders = [PersistentDecoder(
+            use_gpu, gpu_id, mode, model_select, stage_select,
+            n_clients=n_jobs, backend=backend, fp16=fp16)]
+    else:
+        decoders = [
+            PersistentDecoder(use_gpu, gpu_id, mode, model_select, stage_select,
+                              backend=backend, fp16=fp16)
+            for _ in range(n_jobs)]
+    clients = [decoder.client(client_id) for decoder in decoders
+               for client_id in range(decoder.n_clients)]
+    for decoder in decoders:
+        decoder.start()
+
+    # Perform speech enhancement using one worker process per decoder client.
+    # Split the cores between the workers' FFTs, numba kernels (numba >= 0.49
+    # only), and numexpr evaluation rather than oversubscribing.
+    n_threads = max(1, multiprocessing.cpu_count() // n_jobs)
+    job_q = multiprocessing.Queue()
+    result_q = multiprocessing.Queue()
+    for job_id, job in enumerate(jobs):
+        job_q.put((job_id, job))
+    for _ in clients:
+        job_q.put(None)
+    workers = [DenoisingWorker(client, job_q, result_q, n_threads)
+               for client in clients]
+    try:
+        for worker in workers:
+            worker.start()
+        for _ in jobs:
+            job_id, res = _next_result(result_q, decoders, workers)
+            src_wav_file = jobs[job_id]['src_wav_file']
+            if res is None:
+                print('Finished processing file "%s".' % src_wav_file)
+                continue
+            e, tb = res
             msg = 'Problem encountered while processing file "%s". Skipping.' % src_wav_file
             if verbose:
-                msg = '%s Full error output:\n%s' % (msg, e)
+                msg = '%s Full error output:\n%s' % (msg, tb)
             utils.error(msg)
-            continue
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            if worker.pid is not None:
+                worker.join()
+        # Jobs left unread by terminated workers will never be read, so don't
+        # block on flushing them at exit.
+        job_q.cancel_join_thread()
+        for decoder in decoders:
+            decoder.close()
+        # Terminated workers don't get to remove their partial outputs.
+        for job in jobs:
+            tmp_wav_file = get_tmp_wav_file(job['dest_wav_file'])
+            if os.path.exists(tmp_wav_file):
+                os.remove(tmp_wav_file)
 
 
 # TODO: Logging is getting complicated. Consider adding a custom logger...
@@ -327,6 +687,11 @@ def main():
         '--truncate_minutes', nargs=None, default=10, type=float,
         metavar='FLOAT',
         help='maximum chunk size in minutes (default: %(default)s)')
+    parser.add_argument(
+        '--batch_minutes', nargs=None, default=None, type=float,
+        metavar='FLOAT',
+        help='maximum total duration in minutes of chunks decoded together '
+             '(default: same as --truncate_minutes)')
     parser.add_argument(
         '--mode', nargs=None, default=3, type=float,
         metavar='INT',
@@ -339,6 +704,17 @@ def main():
         '--stage_select', nargs=None, default=3, type=int,
         metavar='INT',
         help='which stage(1 or 2 or 3) of PL based model, only works for "1000h model" (default: %(default)s)') 
+    parser.add_argument(
+        '--n_jobs', nargs=None, default=1, type=int, metavar='INT',
+        help='number of parallel jobs (default: %(default)s)')
+    parser.add_argument(
+        '--backend', nargs=None, default='cntk', type=str, metavar='STR',
+        choices=['cntk', 'onnx'],
+        help='library used to apply the model: "cntk" or "onnx" '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--fp16', default=False, action='store_true',
+        help='run the model in FP16; requires --backend onnx')
     parser.add_argument(
         '--verbose', default=False, action='store_true',
         help='print full stacktrace for files with errors')
@@ -349,6 +725,8 @@ def main():
     if not utils.xor(args.wav_dir, args.scpf):
         parser.error('Exactly one of --wav_dir and -S must be set.')
         sys.exit(1)
+    if args.fp16 and args.backend != 'onnx':
+        parser.error('--fp16 requires --backend onnx.')
     use_gpu = args.use_gpu == 'true'
 
     # Determine files to denoise.
@@ -366,7 +744,9 @@ def main():
     # Perform denoising.
     main_denoising(
         wav_files, args.output_dir, args.verbose, use_gpu=use_gpu, gpu_id=args.gpu_id,
-        truncate_minutes=args.truncate_minutes, mode=args.mode, model_select=args.model_select, stage_select=args.stage_select )
+        truncate_minutes=args.truncate_minutes, mode=args.mode, model_select=args.model_select, stage_select=args.stage_select,
+        batch_minutes=args.batch_minutes, n_jobs=args.n_jobs,
+        backend=args.backend, fp16=args.fp16)
 
 #def main_denoising(wav_files, output_dir, verbose=False, **kwargs):
 
@@ -3,7 +3,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 import numbers
 import os
-import sndhdr
 import struct
 import sys
 
@@ -28,69 +27,33 @@ def error(msg):
     print(msg, file=sys.stderr)
 
 
-def stft(x, window, n_per_seg=512, noverlap=256):
-    """Return short-time Fourier transform (STFT) for signal.
+MODEL_CONTEXT = (3, 3) # Left/right context frames input to enhancement models.
+def add_context(x, context=MODEL_CONTEXT):
+    """Splice neighboring frames onto each frame of features.
+
+    This replicates the ``context`` option of CNTK's ``HTKFeatureDeserializer``,
+    which the enhancement models were trained with: frames beyond the edges of
+    ``x`` are replaced by copies of the first/last frame.
 
     Parameters
     ----------
-    x : ndarray, (n_samps,)
-        Input signal.
+    x : ndarray, (n_frames, feature_dim)
+        Features.
 
-    window : ndarray, (wl,)
-        Array of weights to use when windowing the signal.
+    context : tuple of int, optional
+        Number of frames of left and right context.
+        (Default: (3, 3))
 
-    n_per_seg : int, optional
+    Returns
+    -------
+    spliced : ndarray, (n_frames, (n_left + n_right + 1)*feature_dim)
+        Features with context.
     """
-    if len(window) != n_per_seg:
-        raise ValueError('window length must equal n_per_seg')
-    x = np.array(x)
-    nadd = noverlap - (len(x) - n_per_seg) % noverlap
-    x = np.concatenate((x, np.zeros(nadd)))
-    hop_size = n_per_seg - noverlap
-    shape = x.shape[:-1] + ((x.shape[-1] - noverlap) // hop_size, n_per_seg)
-    strides = x.strides[:-1] + (hop_size * x.strides[-1], x.strides[-1])
-    x = np.lib.stride_tricks.as_strided(x, shape=shape, strides=strides)
-    x = x * window
-    result = np.fft.rfft(x, n=n_per_seg)
-    return result
-
-
-def wav2logspec(x, window, n_per_seg=512, noverlap=256):
-    """TODO"""
-    y = stft(x, window, n_per_seg=n_per_seg, noverlap=noverlap)
-    return np.log(np.square(abs(y)) + EPS)
-
-
-
-def logspec2wav(lps, ref_wav, window, n_per_seg=512, noverlap=256):
-    "Convert log-power spectrum back to time domain."""
-    hop_size = n_per_seg - noverlap
-    assert len(window) % hop_size == 0, "The constraint of “Constant OverLap Add” (COLA) is not satisfied!"
-    ref_stft = stft (ref_wav, window, n_per_seg=n_per_seg, noverlap=noverlap) 
-    angle=ref_stft/ (np.abs(ref_stft) + EPS ) # Recover phase information
-    mag_x=np.sqrt(np.exp(lps))* angle
-    frames=np.fft.irfft (mag_x)   
-    back_wav=np.zeros((len(frames) -1) * noverlap + n_per_seg)
-    C1= window[0: hop_size]
-    C2= window[hop_size:]  + window[:noverlap]
-    C3= window[noverlap]
-    back_wav[0:hop_size] = frames[0][0:hop_size] / C1 #
-
-    for i in range (1, len(frames)):
-        back_wav[i*hop_size : i*hop_size+noverlap] = (frames[i-1][hop_size:] + frames[i][:noverlap])/C2
-        back_wav[i*hop_size+noverlap : i*hop_size+ n_per_seg] = frames[i][noverlap:] /C3 
-    back_wav[-hop_size:] =frames[len(frames) -1][noverlap:] /C3  
-    return np.int16(back_wav[0: len(ref_wav)])  
-
-
-
-
-MAX_PCM_VAL = 32767
-def peak_normalization(x):
-    """Perform peak normalization."""
-    norm = x.astype(float)
-    norm = norm / max(abs(norm)) * MAX_PCM_VAL
-    return norm.astype(int)
+    n_left, n_right = context
+    n_frames = x.shape[0]
+    padded = np.pad(x, ((n_left, n_right), (0, 0)), mode='edge')
+    return np.concatenate(
+        [padded[i:i+n_frames] for i in range(n_left + n_right + 1)], axis=1)
 
 
 def read_htk(filename):
@@ -107,16 +70,6 @@ def read_htk(filename):
         return n_samples, samp_period, samp_size, parm_kind, data
 
 
-def write_htk(filename, feature, samp_period, parm_kind):
-    """Write array of frame-level features to HTK binary file."""
-    with open(filename, 'wb') as f:
-        # Write header
-        n_samples = feature.shape[0]
-        samp_size = feature.shape[1] * 4
-        f.write(struct.pack('>iihh', n_samples, samp_period, samp_size, parm_kind))
-        f.write(struct.pack('>%df' % (n_samples * samp_size / 4), *feature.ravel()))
-
-
 VALID_VAD_SRS = {8000, 16000, 32000, 48000}
 VALID_VAD_FRAME_LENGTHS = {10, 20, 30}
 VALID_VAD_MODES = {0, 1, 2, 3}
@@ -301,35 +254,114 @@ def xor(x, y):
     return bool(x) != bool(y)
 
 
+def read_wav_header(fn):
+    """Read format of WAV file from its header.
+
+    The file is opened once and only the RIFF header and the chunk headers
+    preceding the ``fmt`` chunk are read.
+
+    Parameters
+    ----------
+    fn : str
+        Path to file.
+
+    Returns
+    -------
+    sr : int
+        Sample rate in Hz. None if ``fn`` is not a WAV file.
+
+    n_channels : int
+        Number of channels. None if ``fn`` is not a WAV file.
+
+    bitdepth : int
+        Bitdepth. None if ``fn`` is not a WAV file.
+
+    is_wav : bool
+        True if ``fn`` is a WAV file.
+    """
+    not_wav = (None, None, None, False)
+    with open(fn, 'rb') as f:
+        header = f.read(12)
+        if (len(header) < 12 or header[:4] != b'RIFF' or
+                header[8:12] != b'WAVE'):
+            return not_wav
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                return not_wav
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+            if chunk_id == b'fmt ':
+                break
+            # Chunks are padded to an even number of bytes.
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+        fmt = f.read(16)
+        if chunk_size < 16 or len(fmt) < 16:
+            return not_wav
+        _, n_channels, sr, _, _, bitdepth = struct.unpack('<HHIIHH', fmt)
+    return sr, n_channels, bitdepth, True
+
+
+def write_wav_prealloc(fn, sr, n_samples):
+    """Open 16-bit monochannel WAV file for writing a known number of samples.
+
+    As the number of samples is known in advance, the header is written with
+    its final lengths, so that samples may be written to the returned file
+    handle in order as they become available, without buffering them all or
+    revisiting the header afterwards.
+
+    Parameters
+    ----------
+    fn : str
+        Path to output WAV file.
+
+    sr : int
+        Sample rate in Hz.
+
+    n_samples : int
+        Number of samples that will be written.
+
+    Returns
+    -------
+    f : file
+        File opened in binary mode and positioned at the start of the sample
+        data. The caller is responsible for writing exactly ``n_samples``
+        int16 samples and closing it.
+    """
+    block_align = 2
+    data_size = n_samples*block_align
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16,
+        1, 1, sr, sr*block_align, block_align, 8*block_align, b'data',
+        data_size)
+    f = open(fn, 'wb')
+    f.write(header)
+    return f
+
+
 def is_wav(fn):
     """Returns True if ``fn`` is a WAV file."""
-    hinfo = sndhdr.what(fn)
-    if hinfo is None:
-        return False
-    elif hinfo[0] != 'wav':
-        return False
-    return True
+    return read_wav_header(fn)[3]
 
 
 def get_sr(fn):
     """Return sample rate in Hz of WAV file."""
-    if not is_wav(fn):
+    sr, _, _, is_wav_ = read_wav_header(fn)
+    if not is_wav_:
         raise ValueError('File "%s" is not a valid WAV file.' % fn)
-    hinfo = sndhdr.what(fn)
-    return hinfo[1]
+    return sr
 
 
 def get_num_channels(fn):
     """Return number of channels present in  WAV file."""
-    if not is_wav(fn):
+    _, n_channels, _, is_wav_ = read_wav_header(fn)
+    if not is_wav_:
         raise ValueError('File "%s" is not a valid WAV file.' % fn)
-    hinfo = sndhdr.what(fn)
-    return hinfo[2]
+    return n_channels
 
 
 def get_bitdepth(fn):
     """Return bitdepth of WAV file."""
-    if not is_wav(fn):
+    _, _, bitdepth, is_wav_ = read_wav_header(fn)
+    if not is_wav_:
         raise ValueError('File "%s" is not a valid WAV file.' % fn)
-    hinfo = sndhdr.what(fn)
-    return hinfo[4]
+    return bitdepth